@@ -1,10 +1,10 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from database import create_tables, engine
+from database import create_tables, SessionLocal
 from models.account import Account
 from models.transaction import Transaction
 from routers import transactions, accounts
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import select, func
 
 # Create FastAPI app
 app = FastAPI(
@@ -20,8 +20,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# One DB session per request, closed once the response is sent
+@app.middleware("http")
+async def db_session_middleware(request: Request, call_next):
+    request.state.db = SessionLocal()
+    try:
+        return await call_next(request)
+    finally:
+        await request.state.db.close()
+
 # Include routers
 app.include_router(transactions.router)
 app.include_router(accounts.router)
@@ -29,15 +39,14 @@ app.include_router(accounts.router)
 @app.on_event("startup")
 async def startup_event():
     """Initialize database and create default accounts"""
-    create_tables()
+    await create_tables()
     
     # Create default accounts if they don't exist
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     db = SessionLocal()
     
     try:
         # Check if accounts already exist
-        existing_accounts = db.query(Account).count()
+        existing_accounts = await db.scalar(select(func.count()).select_from(Account))
         
         if existing_accounts == 0:
             # Create 3 default accounts
@@ -50,16 +59,16 @@ async def startup_event():
             for account in default_accounts:
                 db.add(account)
             
-            db.commit()
+            await db.commit()
             print("✅ Default accounts created successfully!")
         else:
             print(f"✅ Database already has {existing_accounts} accounts")
             
     except Exception as e:
         print(f"❌ Error creating default accounts: {e}")
-        db.rollback()
+        await db.rollback()
     finally:
-        db.close()
+        await db.close()
 
 @app.get("/")
 async def root():
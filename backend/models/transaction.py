@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -17,5 +17,17 @@ class Transaction(Base):
     # Relationship
     account = relationship("Account", back_populates="transactions")
     
+    __table_args__ = (
+        Index("ix_tx_date", "date"),
+        Index("ix_tx_account_date", "account_id", "date"),
+        # Trigram index so ILIKE '%term%' searches can use an index on PostgreSQL
+        Index(
+            "ix_tx_description_trgm",
+            "description",
+            postgresql_using="gin",
+            postgresql_ops={"description": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
+    
     def __repr__(self):
         return f"<Transaction(id={self.id}, description='{self.description}', amount={self.amount})>" 
\ No newline at end of file
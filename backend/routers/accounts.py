@@ -1,14 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from typing import List
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from datetime import datetime, timedelta
+from itertools import accumulate
 
 from database import get_db
 from models.account import Account
 from models.transaction import Transaction
 
-router = APIRouter(prefix="/accounts", tags=["accounts"])
+router = APIRouter(prefix="/accounts", tags=["accounts"], default_response_class=ORJSONResponse)
 
 # Pydantic schemas
 class AccountCreate(BaseModel):
@@ -20,32 +23,33 @@ class AccountResponse(BaseModel):
     name: str
     balance: float
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class AccountBalanceHistory(BaseModel):
     date: str
     balance: float
 
 @router.get("/", response_model=List[AccountResponse])
-async def get_accounts(db: Session = Depends(get_db)):
+async def get_accounts(db: AsyncSession = Depends(get_db)):
     """Get all accounts"""
-    accounts = db.query(Account).all()
+    result = await db.execute(select(Account))
+    accounts = result.scalars().all()
     return accounts
 
 @router.post("/", response_model=AccountResponse)
-async def create_account(account: AccountCreate, db: Session = Depends(get_db)):
+async def create_account(account: AccountCreate, db: AsyncSession = Depends(get_db)):
     """Create a new account"""
-    db_account = Account(**account.dict())
+    db_account = Account(**account.model_dump())
     db.add(db_account)
-    db.commit()
-    db.refresh(db_account)
+    await db.commit()
+    await db.refresh(db_account)
     return db_account
 
 @router.get("/balance", response_model=dict)
-async def get_accounts_balance(db: Session = Depends(get_db)):
+async def get_accounts_balance(db: AsyncSession = Depends(get_db)):
     """Get current balance for all accounts"""
-    accounts = db.query(Account).all()
+    result = await db.execute(select(Account))
+    accounts = result.scalars().all()
     balance_data = {}
     
     for account in accounts:
@@ -61,47 +65,42 @@ async def get_accounts_balance(db: Session = Depends(get_db)):
 async def get_account_balance_history(
     account_id: int, 
     days: int = 30,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get balance history for a specific account"""
-    account = db.query(Account).filter(Account.id == account_id).first()
+    account = await db.scalar(select(Account).where(Account.id == account_id))
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
     
     # Get transactions for the last N days
     start_date = datetime.now() - timedelta(days=days)
-    transactions = db.query(Transaction).filter(
+    # Only the columns the history needs, as plain rows instead of ORM objects
+    result = await db.execute(select(
+        Transaction.date,
+        Transaction.transaction_type,
+        Transaction.amount
+    ).where(
         Transaction.account_id == account_id,
         Transaction.date >= start_date
-    ).order_by(Transaction.date).all()
+    ).order_by(Transaction.date))
+    transactions = result.all()
     
     # Calculate balance history
-    balance_history = []
-    current_balance = account.balance
+    deltas = [
+        transaction.amount if transaction.transaction_type == "entrada" else -transaction.amount
+        for transaction in transactions
+    ]
     
-    # Calculate initial balance (balance before the start_date)
-    for transaction in reversed(transactions):
-        if transaction.transaction_type == "entrada":
-            current_balance -= transaction.amount
-        else:
-            current_balance += transaction.amount
-    
-    # Build history forward
-    balance_history.append({
+    # Start from the balance before start_date and build history forward
+    balances = accumulate(deltas, initial=account.balance - sum(deltas))
+    balance_history = [{
         "date": start_date.strftime("%Y-%m-%d"),
-        "balance": current_balance
-    })
-    
-    for transaction in transactions:
-        if transaction.transaction_type == "entrada":
-            current_balance += transaction.amount
-        else:
-            current_balance -= transaction.amount
-            
-        balance_history.append({
-            "date": transaction.date.strftime("%Y-%m-%d"),
-            "balance": current_balance
-        })
+        "balance": next(balances)
+    }]
+    balance_history.extend(
+        {"date": transaction.date.strftime("%Y-%m-%d"), "balance": balance}
+        for transaction, balance in zip(transactions, balances)
+    )
     
     return balance_history
 
@@ -109,16 +108,16 @@ async def get_account_balance_history(
 async def update_account(
     account_id: int, 
     account_update: AccountCreate, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Update an account"""
-    account = db.query(Account).filter(Account.id == account_id).first()
+    account = await db.scalar(select(Account).where(Account.id == account_id))
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
     
     account.name = account_update.name
     account.balance = account_update.balance
     
-    db.commit()
-    db.refresh(account)
+    await db.commit()
+    await db.refresh(account)
     return account 
\ No newline at end of file
@@ -1,15 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import extract
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import extract, func, lambda_stmt, select, tuple_, update
 from typing import List, Optional
-from datetime import datetime, date
-from pydantic import BaseModel
+from urllib.parse import urlencode
+from datetime import datetime, date, timezone
+import hashlib
+import json
+from pydantic import BaseModel, ConfigDict, field_validator
 
 from database import get_db
 from models.transaction import Transaction
 from models.account import Account
 
-router = APIRouter(prefix="/transactions", tags=["transactions"])
+router = APIRouter(prefix="/transactions", tags=["transactions"], default_response_class=ORJSONResponse)
+
+# Per-process cache of monthly summaries: year -> (etag, summary)
+_monthly_summary_cache = {}
+# Bumped on every write touching a year, so in-flight computations can't cache stale data
+_monthly_summary_versions = {}
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Convert an aware datetime to naive UTC, the form Transaction.date is stored in"""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
 
 # Pydantic schemas
 class TransactionCreate(BaseModel):
@@ -19,6 +34,8 @@ class TransactionCreate(BaseModel):
     category: str
     amount: float
     account_id: int
+    
+    _date_to_naive_utc = field_validator("date")(_naive_utc)
 
 class TransactionUpdate(BaseModel):
     date: Optional[datetime] = None
@@ -27,6 +44,14 @@ class TransactionUpdate(BaseModel):
     category: Optional[str] = None
     amount: Optional[float] = None
     account_id: Optional[int] = None
+    
+    @field_validator("date")
+    @classmethod
+    def _date_to_naive_utc(cls, value: Optional[datetime]) -> datetime:
+        # Omit the field to keep the current date; null would blank it out
+        if value is None:
+            raise ValueError("date cannot be null")
+        return _naive_utc(value)
 
 class TransactionResponse(BaseModel):
     id: int
@@ -37,160 +62,199 @@ class TransactionResponse(BaseModel):
     amount: float
     account_id: int
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
+
+def _date_range(year: int, month: Optional[int] = None):
+    """Return the half-open [start, end) datetime range for a year or month"""
+    if month is None:
+        return datetime(year, 1, 1), datetime(year + 1, 1, 1)
+    return datetime(year, month, 1), datetime(year + (month == 12), month % 12 + 1, 1)
 
-@router.get("/", response_model=List[TransactionResponse])
+def _signed_amount(transaction_type: str, amount: float) -> float:
+    """Return the balance effect of a transaction: positive for entrada, negative for saida"""
+    return amount if transaction_type == "entrada" else -amount
+
+def _invalidate_monthly_summary(*dates: Optional[datetime]):
+    """Drop cached monthly summaries for the years of the given dates"""
+    for value in dates:
+        if value is None:
+            continue
+        _monthly_summary_versions[value.year] = _monthly_summary_versions.get(value.year, 0) + 1
+        _monthly_summary_cache.pop(value.year, None)
+
+async def _apply_balance_delta(db: AsyncSession, account_id: int, delta: float) -> bool:
+    """Add delta to an account balance in SQL; return False if the account does not exist"""
+    result = await db.execute(
+        update(Account)
+        .where(Account.id == account_id)
+        .values(balance=Account.balance + delta)
+    )
+    return result.rowcount > 0
+
+@router.get("/", response_model=None, responses={200: {"model": List[TransactionResponse]}})
 async def get_transactions(
-    skip: int = 0,
-    limit: int = 100,
-    month: Optional[int] = Query(None, description="Filter by month (1-12)"),
-    year: Optional[int] = Query(None, description="Filter by year"),
+    limit: int = Query(100, ge=1, description="Maximum number of transactions to return"),
+    before_date: Optional[datetime] = Query(None, description="Cursor: date of the last transaction seen"),
+    before_id: Optional[int] = Query(None, description="Cursor: id of the last transaction seen"),
+    month: Optional[int] = Query(None, ge=1, le=12, description="Filter by month (1-12)"),
+    year: Optional[int] = Query(None, ge=1, le=9998, description="Filter by year"),
     transaction_type: Optional[str] = Query(None, description="Filter by type (entrada/saida)"),
     category: Optional[str] = Query(None, description="Filter by category"),
     account_id: Optional[int] = Query(None, description="Filter by account"),
     description: Optional[str] = Query(None, description="Filter by description"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get transactions with optional filters"""
-    query = db.query(Transaction)
+    """Get transactions with optional filters, newest first
+    
+    Pages are keyset-paginated: when more rows may follow, the X-Next-Cursor
+    header holds the before_date/before_id query params for the next page.
+    Transactions without a date can't be placed in that order and are excluded.
+    Rows are serialized directly by orjson, skipping response_model validation.
+    """
+    # Lambda statements cache their compiled SQL per combination of filters,
+    # so repeat requests only bind new parameter values
+    query = lambda_stmt(lambda: select(
+        Transaction.id,
+        Transaction.date,
+        Transaction.description,
+        Transaction.transaction_type,
+        Transaction.category,
+        Transaction.amount,
+        Transaction.account_id
+    ).where(Transaction.date.isnot(None)))
     
-    if month:
-        query = query.filter(extract('month', Transaction.date) == month)
     if year:
-        query = query.filter(extract('year', Transaction.date) == year)
+        # Range predicates keep the date index usable
+        start, end = _date_range(year, month)
+        query += lambda s: s.where(Transaction.date >= start, Transaction.date < end)
+    elif month:
+        query += lambda s: s.where(extract('month', Transaction.date) == month)
     if transaction_type:
-        query = query.filter(Transaction.transaction_type == transaction_type)
+        query += lambda s: s.where(Transaction.transaction_type == transaction_type)
     if category:
-        query = query.filter(Transaction.category == category)
+        query += lambda s: s.where(Transaction.category == category)
     if account_id:
-        query = query.filter(Transaction.account_id == account_id)
-    if description:
-        query = query.filter(Transaction.description.ilike(f"%{description}%"))
+        query += lambda s: s.where(Transaction.account_id == account_id)
+    if description and description.strip():
+        pattern = f"%{description}%"
+        query += lambda s: s.where(Transaction.description.ilike(pattern))
     
-    transactions = query.offset(skip).limit(limit).all()
-    return transactions
+    if (before_date is None) != (before_id is None):
+        raise HTTPException(status_code=422, detail="before_date and before_id must be given together")
+    
+    before_date = _naive_utc(before_date)
+    if before_date is not None:
+        query += lambda s: s.where(tuple_(Transaction.date, Transaction.id) < tuple_(before_date, before_id))
+    
+    query += lambda s: s.order_by(Transaction.date.desc(), Transaction.id.desc()).limit(limit)
+    result = await db.execute(query)
+    rows = result.all()
+    
+    response = ORJSONResponse([row._asdict() for row in rows])
+    if len(rows) == limit:
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = urlencode({
+            "before_date": last.date.isoformat(),
+            "before_id": last.id
+        })
+    
+    return response
 
 @router.post("/", response_model=TransactionResponse)
-async def create_transaction(transaction: TransactionCreate, db: Session = Depends(get_db)):
+async def create_transaction(transaction: TransactionCreate, db: AsyncSession = Depends(get_db)):
     """Create a new transaction"""
-    # Verify account exists
-    account = db.query(Account).filter(Account.id == transaction.account_id).first()
-    if not account:
+    # Update account balance (no matching row means the account does not exist)
+    delta = _signed_amount(transaction.transaction_type, transaction.amount)
+    if not await _apply_balance_delta(db, transaction.account_id, delta):
         raise HTTPException(status_code=404, detail="Account not found")
     
-    db_transaction = Transaction(**transaction.dict())
+    db_transaction = Transaction(**transaction.model_dump())
     db.add(db_transaction)
     
-    # Update account balance
-    if transaction.transaction_type == "entrada":
-        account.balance += transaction.amount
-    else:
-        account.balance -= transaction.amount
-    
-    db.commit()
-    db.refresh(db_transaction)
+    await db.commit()
+    _invalidate_monthly_summary(db_transaction.date)
+    await db.refresh(db_transaction)
     return db_transaction
 
 @router.put("/{transaction_id}", response_model=TransactionResponse)
 async def update_transaction(
     transaction_id: int,
     transaction_update: TransactionUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Update a transaction"""
-    db_transaction = db.query(Transaction).filter(Transaction.id == transaction_id).first()
+    # Lock the row so concurrent edits can't revert the same old values twice
+    db_transaction = await db.scalar(
+        select(Transaction).where(Transaction.id == transaction_id).with_for_update()
+    )
     if not db_transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
     
-    # Get old values for balance adjustment
+    # Get old and new values for balance adjustment
     old_account_id = db_transaction.account_id
-    old_amount = db_transaction.amount
-    old_type = db_transaction.transaction_type
+    old_date = db_transaction.date
+    old_delta = _signed_amount(db_transaction.transaction_type, db_transaction.amount)
+    new_account_id = transaction_update.account_id or old_account_id
+    new_delta = _signed_amount(
+        transaction_update.transaction_type or db_transaction.transaction_type,
+        transaction_update.amount if transaction_update.amount is not None else db_transaction.amount
+    )
     
     # Update fields
-    update_data = transaction_update.dict(exclude_unset=True)
+    update_data = transaction_update.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(db_transaction, field, value)
     
-    # Handle account change and balance updates
-    if transaction_update.account_id and transaction_update.account_id != old_account_id:
-        # Verify new account exists
-        new_account = db.query(Account).filter(Account.id == transaction_update.account_id).first()
-        if not new_account:
+    # Revert old values and apply new ones
+    if new_account_id != old_account_id:
+        if not await _apply_balance_delta(db, new_account_id, new_delta):
             raise HTTPException(status_code=404, detail="New account not found")
-        
-        # Revert old account balance
-        old_account = db.query(Account).filter(Account.id == old_account_id).first()
-        if old_account:
-            if old_type == "entrada":
-                old_account.balance -= old_amount
-            else:
-                old_account.balance += old_amount
-        
-        # Apply to new account
-        new_amount = transaction_update.amount if transaction_update.amount is not None else old_amount
-        new_type = transaction_update.transaction_type if transaction_update.transaction_type else old_type
-        
-        if new_type == "entrada":
-            new_account.balance += new_amount
-        else:
-            new_account.balance -= new_amount
+        await _apply_balance_delta(db, old_account_id, -old_delta)
     else:
-        # Same account, handle amount or type changes
-        account = db.query(Account).filter(Account.id == old_account_id).first()
-        if account:
-            # Revert old values
-            if old_type == "entrada":
-                account.balance -= old_amount
-            else:
-                account.balance += old_amount
-            
-            # Apply new values
-            new_amount = transaction_update.amount if transaction_update.amount is not None else old_amount
-            new_type = transaction_update.transaction_type if transaction_update.transaction_type else old_type
-            
-            if new_type == "entrada":
-                account.balance += new_amount
-            else:
-                account.balance -= new_amount
+        await _apply_balance_delta(db, old_account_id, new_delta - old_delta)
     
-    db.commit()
-    db.refresh(db_transaction)
+    # Every column is already set in memory, so no refresh is needed
+    await db.commit()
+    _invalidate_monthly_summary(old_date, db_transaction.date)
     return db_transaction
 
 @router.delete("/{transaction_id}")
-async def delete_transaction(transaction_id: int, db: Session = Depends(get_db)):
+async def delete_transaction(transaction_id: int, db: AsyncSession = Depends(get_db)):
     """Delete a transaction"""
-    db_transaction = db.query(Transaction).filter(Transaction.id == transaction_id).first()
+    # Lock the row so concurrent edits can't revert the same old values twice
+    db_transaction = await db.scalar(
+        select(Transaction).where(Transaction.id == transaction_id).with_for_update()
+    )
     if not db_transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
     
     # Update account balance
-    account = db.query(Account).filter(Account.id == db_transaction.account_id).first()
-    if account:
-        if db_transaction.transaction_type == "entrada":
-            account.balance -= db_transaction.amount
-        else:
-            account.balance += db_transaction.amount
+    delta = _signed_amount(db_transaction.transaction_type, db_transaction.amount)
+    await _apply_balance_delta(db, db_transaction.account_id, -delta)
     
-    db.delete(db_transaction)
-    db.commit()
+    await db.delete(db_transaction)
+    await db.commit()
+    _invalidate_monthly_summary(db_transaction.date)
     return {"detail": "Transaction deleted successfully"}
 
-@router.get("/monthly", response_model=dict)
-async def get_monthly_summary(
-    year: int = Query(..., description="Year for summary"),
-    db: Session = Depends(get_db)
-):
-    """Get monthly transaction summary"""
-    transactions = db.query(Transaction).filter(
-        extract('year', Transaction.date) == year
-    ).all()
+async def _compute_monthly_summary(db: AsyncSession, year: int) -> dict:
+    """Aggregate entradas, saidas and counts per month for a year"""
+    start, end = _date_range(year)
+    month = extract('month', Transaction.date).label('month')
+    result = await db.execute(select(
+        month,
+        Transaction.transaction_type,
+        func.sum(Transaction.amount),
+        func.count()
+    ).where(
+        Transaction.date >= start,
+        Transaction.date < end
+    ).group_by(month, Transaction.transaction_type))
+    rows = result.all()
     
     monthly_summary = {}
-    for transaction in transactions:
-        month = transaction.date.month
+    for month, transaction_type, amount, count in rows:
+        month = int(month)
         if month not in monthly_summary:
             monthly_summary[month] = {
                 "entrada": 0,
@@ -199,15 +263,42 @@ async def get_monthly_summary(
                 "count": 0
             }
         
-        if transaction.transaction_type == "entrada":
-            monthly_summary[month]["entrada"] += transaction.amount
+        if transaction_type == "entrada":
+            monthly_summary[month]["entrada"] += amount
         else:
-            monthly_summary[month]["saida"] += transaction.amount
+            monthly_summary[month]["saida"] += amount
             
-        monthly_summary[month]["count"] += 1
+        monthly_summary[month]["count"] += count
     
     # Calculate totals
     for month_data in monthly_summary.values():
         month_data["total"] = month_data["entrada"] - month_data["saida"]
     
-    return monthly_summary 
\ No newline at end of file
+    return monthly_summary
+
+@router.get("/monthly", response_model=dict)
+async def get_monthly_summary(
+    request: Request,
+    response: Response,
+    year: int = Query(..., ge=1, le=9998, description="Year for summary"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get monthly transaction summary"""
+    cached = _monthly_summary_cache.get(year)
+    if cached is None:
+        version = _monthly_summary_versions.get(year, 0)
+        monthly_summary = await _compute_monthly_summary(db, year)
+        digest = hashlib.sha1(json.dumps(monthly_summary, sort_keys=True).encode()).hexdigest()[:16]
+        cached = (f'W/"{year}-{digest}"', monthly_summary)
+        # Don't cache a result that a concurrent write has already made stale
+        if _monthly_summary_versions.get(year, 0) == version:
+            _monthly_summary_cache[year] = cached
+    
+    etag, monthly_summary = cached
+    # Transactions can be back-dated, so clients must always revalidate
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    response.headers.update(headers)
+    return monthly_summary 